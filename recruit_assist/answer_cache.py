@@ -0,0 +1,161 @@
+from array import array
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import hashlib
+import logging
+import math
+import sqlite3
+import threading
+
+from recruit_assist import db
+from recruit_assist.constants import (
+    ANSWER_CACHE_TTL_SECONDS,
+    ANSWER_MEMORY_CACHE_SIZE,
+    SEMANTIC_THRESHOLD,
+)
+
+logger = logging.getLogger(__name__)
+
+# Answers this container recently read or wrote, as key -> (response, expires_at)
+_recent_answers = OrderedDict()
+_recent_answers_lock = threading.Lock()
+
+# Semantic indexes of recently asked-about PDFs, as
+# pdf_id -> (answer key -> embedding, last sem_cache rowid read)
+_semantic_indexes = OrderedDict()
+SEMANTIC_INDEX_CACHE_SIZE = 128
+
+
+def answer_cache_key(pdf_id, query):
+    normalized_query = query.strip().lower()
+    return hashlib.sha256((pdf_id + "\x00" + normalized_query).encode()).hexdigest()
+
+
+def _remember_answer(key, response, expires_at):
+    with _recent_answers_lock:
+        _recent_answers[key] = (response, expires_at)
+        _recent_answers.move_to_end(key)
+        if len(_recent_answers) > ANSWER_MEMORY_CACHE_SIZE:
+            _recent_answers.popitem(last=False)
+
+
+def get_cached_answer(key):
+    now = datetime.now().isoformat()
+    with _recent_answers_lock:
+        entry = _recent_answers.get(key)
+    if entry is not None and entry[1] > now:
+        return entry[0]
+    try:
+        with db.connection() as conn:
+            result = conn.execute(
+                "SELECT response, expires_at FROM answers"
+                " WHERE key = ? AND expires_at > ?",
+                (key, now),
+            ).fetchone()
+    except sqlite3.Error as e:
+        logger.error("SQLite error reading answer cache for key %s: %s", key, e)
+        return None
+    if result is None:
+        return None
+    _remember_answer(key, *result)
+    return result[0]
+
+
+def cache_answer(key, response):
+    now = datetime.now()
+    expires_at = now + timedelta(seconds=ANSWER_CACHE_TTL_SECONDS)
+    try:
+        with db.connection() as conn:
+            pruned = conn.execute(
+                "DELETE FROM answers WHERE expires_at <= ?", (now.isoformat(),)
+            ).rowcount
+            if pruned:
+                conn.execute(
+                    "DELETE FROM sem_cache"
+                    " WHERE answer_key NOT IN (SELECT key FROM answers)"
+                )
+            conn.execute(
+                "INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?)",
+                (key, response, now.isoformat(), expires_at.isoformat()),
+            )
+    except sqlite3.Error as e:
+        logger.error("SQLite error caching answer for key %s: %s", key, e)
+        return
+    _remember_answer(key, response, expires_at.isoformat())
+
+
+def normalize_embedding(values):
+    norm = math.sqrt(math.sumprod(values, values))
+    return array("f", (v / norm for v in values)) if norm else array("f", values)
+
+
+def _load_semantic_index(pdf_id):
+    """Returns answer key -> embedding for a PDF.
+
+    Other containers add entries too, so each call reads the rows added since
+    the previous one rather than trusting what this container loaded earlier.
+    """
+    with db.connection() as conn:
+        index, last_rowid = _semantic_indexes.pop(pdf_id, ({}, 0))
+        rows = conn.execute(
+            "SELECT rowid, embedding, answer_key FROM sem_cache"
+            " WHERE pdf_id = ? AND rowid > ? ORDER BY rowid",
+            (pdf_id, last_rowid),
+        ).fetchall()
+        for rowid, embedding_bytes, answer_key in rows:
+            embedding = array("f")
+            embedding.frombytes(embedding_bytes)
+            index[answer_key] = embedding
+            last_rowid = rowid
+        _semantic_indexes[pdf_id] = (index, last_rowid)
+        if len(_semantic_indexes) > SEMANTIC_INDEX_CACHE_SIZE:
+            _semantic_indexes.popitem(last=False)
+    return index
+
+
+def has_semantic_entries(pdf_id):
+    try:
+        return bool(_load_semantic_index(pdf_id))
+    except sqlite3.Error as e:
+        logger.error("SQLite error loading semantic cache for PDF ID %s: %s", pdf_id, e)
+        return False
+
+
+def find_similar_answer_key(pdf_id, embedding):
+    """Returns the answer key of the most similar cached question, if close enough.
+
+    `embedding` must be normalized so the dot product is the cosine similarity.
+    """
+    try:
+        index = _load_semantic_index(pdf_id)
+    except sqlite3.Error as e:
+        logger.error("SQLite error loading semantic cache for PDF ID %s: %s", pdf_id, e)
+        return None
+    best_similarity, best_key = -1.0, None
+    for answer_key, cached_embedding in index.items():
+        if len(cached_embedding) != len(embedding):
+            continue
+        similarity = math.sumprod(cached_embedding, embedding)
+        if similarity > best_similarity:
+            best_similarity, best_key = similarity, answer_key
+    if best_similarity >= SEMANTIC_THRESHOLD:
+        logger.info(
+            "Semantic cache match for PDF ID %s (similarity %.3f)",
+            pdf_id,
+            best_similarity,
+        )
+        return best_key
+    return None
+
+
+def add_semantic_entry(pdf_id, embedding, answer_key):
+    try:
+        with db.connection() as conn:
+            # A regenerated answer replaces its entry rather than adding another
+            conn.execute(
+                "INSERT OR REPLACE INTO sem_cache (pdf_id, embedding, answer_key)"
+                " VALUES (?, ?, ?)",
+                (pdf_id, embedding.tobytes(), answer_key),
+            )
+    except sqlite3.Error as e:
+        logger.error("SQLite error adding semantic cache entry for %s: %s", pdf_id, e)
@@ -1,4 +1,48 @@
+import os
 from pathlib import Path
 
 DATA_DIR_IN_CONTAINER = Path("/data")
 DB_FILE = str(DATA_DIR_IN_CONTAINER / "pdf_qa_logs.db")
+
+# Cached answers older than this are ignored and pruned on the next write
+ANSWER_CACHE_TTL_SECONDS = int(
+    os.environ.get("ANSWER_CACHE_TTL_SECONDS", 7 * 24 * 3600)
+)
+
+# Cosine similarity above which a paraphrased question reuses a cached answer
+SEMANTIC_THRESHOLD = float(os.environ.get("SEMANTIC_THRESHOLD", 0.92))
+# Number of cached answers each container also keeps in memory
+ANSWER_MEMORY_CACHE_SIZE = int(os.environ.get("ANSWER_MEMORY_CACHE_SIZE", 1024))
+EMBEDDING_MODEL = os.environ.get("EMBEDDING_MODEL", "text-embedding-004")
+
+# Lifetime of the Gemini context cache holding each PDF's text
+CONTEXT_CACHE_TTL_SECONDS = int(os.environ.get("CONTEXT_CACHE_TTL_SECONDS", 3600))
+# Shorter documents are sent in full: Gemini only caches contexts of at least
+# 32,768 tokens, roughly four characters each
+CONTEXT_CACHE_MIN_CHARS = int(os.environ.get("CONTEXT_CACHE_MIN_CHARS", 4 * 32_768))
+
+# The deployed database lives on a network filesystem shared by every container,
+# where WAL's shared-memory index and memory-mapped I/O aren't safe. WAL and a
+# nonzero SQLITE_MMAP_SIZE are only for databases on a single host's local disk.
+SQLITE_JOURNAL_MODE = os.environ.get("SQLITE_JOURNAL_MODE", "DELETE")
+SQLITE_MMAP_SIZE = int(os.environ.get("SQLITE_MMAP_SIZE", 0))
+
+# PDFs with at least this many pages are extracted across worker processes
+PDF_PARALLEL_MIN_PAGES = int(os.environ.get("PDF_PARALLEL_MIN_PAGES", 32))
+
+# Extracted PDF text is stored zlib-compressed at this level (0-9)
+PDF_TEXT_ZLIB_LEVEL = int(os.environ.get("PDF_TEXT_ZLIB_LEVEL", 6))
+
+# Documents with at least this many characters (~100k tokens) are answered from
+# the RETRIEVAL_TOP_K chunks most relevant to the question instead of in full
+RETRIEVAL_MIN_CHARS = int(os.environ.get("RETRIEVAL_MIN_CHARS", 400_000))
+RETRIEVAL_CHUNK_CHARS = int(os.environ.get("RETRIEVAL_CHUNK_CHARS", 2000))
+RETRIEVAL_TOP_K = int(os.environ.get("RETRIEVAL_TOP_K", 8))
+
+# Number of decompressed PDF texts each container keeps in memory
+PDF_TEXT_CACHE_SIZE = int(os.environ.get("PDF_TEXT_CACHE_SIZE", 32))
+
+# Answer chunks arriving within SSE_BATCH_SECONDS of each other are sent as one
+# SSE event, until the event holds at least SSE_BATCH_CHARS characters
+SSE_BATCH_SECONDS = float(os.environ.get("SSE_BATCH_SECONDS", 0.05))
+SSE_BATCH_CHARS = int(os.environ.get("SSE_BATCH_CHARS", 64))
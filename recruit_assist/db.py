@@ -0,0 +1,30 @@
+import contextlib
+import functools
+import sqlite3
+import threading
+
+from recruit_assist.constants import DB_FILE, SQLITE_JOURNAL_MODE, SQLITE_MMAP_SIZE
+
+# Serializes use of the shared connection across threads
+DB_LOCK = threading.Lock()
+
+
+@functools.lru_cache(maxsize=1)
+def get_connection():
+    """Opens the process-wide connection once, in autocommit mode."""
+    conn = sqlite3.connect(DB_FILE, check_same_thread=False, isolation_level=None)
+    conn.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+    # NORMAL only avoids corruption on power loss in WAL mode
+    synchronous = "NORMAL" if SQLITE_JOURNAL_MODE.upper() == "WAL" else "FULL"
+    conn.execute(f"PRAGMA synchronous={synchronous}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-64000")
+    conn.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    return conn
+
+
+@contextlib.contextmanager
+def connection():
+    """Yields the shared connection while holding the lock that guards it."""
+    with DB_LOCK:
+        yield get_connection()
@@ -5,6 +5,7 @@ import sqlite3
 import modal
 import logging
 
+from recruit_assist import db
 from recruit_assist.constants import DATA_DIR_IN_CONTAINER, DB_FILE
 
 NFS = modal.NetworkFileSystem.from_name(
@@ -61,7 +62,7 @@ app = modal.App("pdf-qa-app-deployment", image=image)
 
 
 try:
-    from recruit_assist.main import app as pdf_qa_fasthtml_app
+    from recruit_assist.main import app as pdf_qa_fasthtml_app, get_model_client
 
     logger.info("Successfully imported FastHTML app from main.py")
 except ImportError as e:
@@ -69,36 +70,130 @@ except ImportError as e:
     pdf_qa_fasthtml_app = None
 
 
+def _add_missing_columns(c, table, columns):
+    """Migrates tables created before `columns` were added to the schema."""
+    existing = {row[1] for row in c.execute(f"PRAGMA table_info({table})")}
+    for name, column_type in columns.items():
+        if name not in existing:
+            try:
+                c.execute(f"ALTER TABLE {table} ADD COLUMN {name} {column_type}")
+            except sqlite3.OperationalError as e:
+                if "duplicate column name" not in str(e):
+                    raise
+                continue
+            logger.info("Added column %s.%s", table, name)
+
+
+def _add_unique_index(c, table, index, columns):
+    """Adds a unique index, first dropping all but the newest row of each duplicate."""
+    exists = c.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?", (index,)
+    ).fetchone()
+    if exists:
+        return
+    key = ", ".join(columns)
+    c.execute(
+        f"DELETE FROM {table} WHERE rowid NOT IN"
+        f" (SELECT MAX(rowid) FROM {table} GROUP BY {key})"
+    )
+    c.execute(f"CREATE UNIQUE INDEX {index} ON {table}({key})")
+    logger.info("Added unique index %s", index)
+
+
 def init_db():
     DATA_DIR_IN_CONTAINER.mkdir(parents=True, exist_ok=True)
-    conn = sqlite3.connect(DB_FILE)
+    conn = sqlite3.connect(DB_FILE, isolation_level=None)
     c = conn.cursor()
-    c.execute(
-        """
-        CREATE TABLE IF NOT EXISTS interactions (
-            id TEXT PRIMARY KEY,
-            timestamp TEXT,
-            pdf_id TEXT,
-            query TEXT,
-            response TEXT
+    # Containers start concurrently, so the schema is checked and migrated
+    # while holding the write lock
+    c.execute("BEGIN IMMEDIATE")
+    try:
+        c.execute(
+            """
+            CREATE TABLE IF NOT EXISTS interactions (
+                id TEXT PRIMARY KEY,
+                timestamp TEXT,
+                pdf_id TEXT,
+                query TEXT,
+                response TEXT
+            )
+            """
         )
-        """
-    )
-    c.execute(
-        """
-        CREATE TABLE IF NOT EXISTS pdfs (
-            id TEXT PRIMARY KEY,
-            filename TEXT,
-            text TEXT
+        c.execute(
+            "CREATE INDEX IF NOT EXISTS interactions_pdf_id_timestamp"
+            " ON interactions(pdf_id, timestamp)"
         )
-        """
-    )
-    conn.commit()
+        c.execute(
+            """
+            CREATE TABLE IF NOT EXISTS pdfs (
+                id TEXT PRIMARY KEY,
+                filename TEXT,
+                text TEXT,
+                cache_name TEXT,
+                cache_expires_at TEXT
+            )
+            """
+        )
+        _add_missing_columns(
+            c, "pdfs", {"cache_name": "TEXT", "cache_expires_at": "TEXT"}
+        )
+        # Document text lives apart from the small, frequently read pdfs rows.
+        # pdfs.text only holds text stored before this, until it is next read.
+        c.execute(
+            """
+            CREATE TABLE IF NOT EXISTS pdf_text (
+                id TEXT PRIMARY KEY,
+                text_z BLOB
+            )
+            """
+        )
+        c.execute(
+            """
+            CREATE TABLE IF NOT EXISTS answers (
+                key TEXT PRIMARY KEY,
+                response TEXT,
+                created_at TEXT,
+                expires_at TEXT
+            )
+            """
+        )
+        # Expired answers are pruned on every write
+        c.execute(
+            "CREATE INDEX IF NOT EXISTS answers_expires_at ON answers(expires_at)"
+        )
+        c.execute(
+            """
+            CREATE TABLE IF NOT EXISTS sem_cache (
+                pdf_id TEXT,
+                embedding BLOB,
+                answer_key TEXT
+            )
+            """
+        )
+        c.execute("CREATE INDEX IF NOT EXISTS sem_cache_pdf_id ON sem_cache(pdf_id)")
+        _add_unique_index(
+            c, "sem_cache", "sem_cache_pdf_id_answer_key", ("pdf_id", "answer_key")
+        )
+        c.execute(
+            """
+            CREATE TABLE IF NOT EXISTS chunks (
+                pdf_id TEXT,
+                idx INTEGER,
+                text TEXT,
+                embedding BLOB,
+                PRIMARY KEY (pdf_id, idx)
+            )
+            """
+        )
+    except sqlite3.Error:
+        c.execute("ROLLBACK")
+        raise
+    c.execute("COMMIT")
     conn.close()
     logger.info("Database initialized/verified at %s", DB_FILE)
 
 
-@app.function(
+@app.cls(
     secrets=[modal.Secret.from_name("llm-secrets")],
     network_file_systems={str(DATA_DIR_IN_CONTAINER): NFS},
     # WARNING: Concurrency limit might be needed if SQLite access isn't thread-safe
@@ -106,28 +201,43 @@ def init_db():
     # concurrency_limit=1,
 )
 @modal.concurrent(max_inputs=1000)
-@modal.asgi_app()
-def serve_main_app():
-    """
-    Serves the imported FastHTML app from main.py.
-    """
-    logger.info("Serving the main PDF QA FastHTML app...")
-    if pdf_qa_fasthtml_app is None:
-        logger.error("Cannot serve: FastHTML app from main.py failed to import.")
-        import fasthtml.common as fh
-
-        error_app, error_rt = fh.fast_app()
-
-        @error_rt("/")
-        def error_route():
-            return fh.H1("Error: Application failed to load.")
+class MainApp:
+    @modal.enter()
+    def warm_up(self):
+        """Prepares the database and Gemini client before the container takes requests."""
+        if pdf_qa_fasthtml_app is None:
+            return
+        DATA_DIR_IN_CONTAINER.mkdir(parents=True, exist_ok=True)
+        init_db()
+        # Opens the shared connection and applies its PRAGMAs
+        db.get_connection()
+        try:
+            get_model_client()
+        except Exception as e:
+            logger.error(f"Failed to create Gemini client: {e}")
+        logger.info("Container warmed up")
 
-        return error_app
+    # Pins the URL this endpoint had as a plain function; Modal would otherwise
+    # add the class name to the hostname
+    @modal.asgi_app(label="pdf-qa-app-deployment-serve-main-app")
+    def serve_main_app(self):
+        """
+        Serves the imported FastHTML app from main.py.
+        """
+        logger.info("Serving the main PDF QA FastHTML app...")
+        if pdf_qa_fasthtml_app is None:
+            logger.error("Cannot serve: FastHTML app from main.py failed to import.")
+            import fasthtml.common as fh
 
-    DATA_DIR_IN_CONTAINER.mkdir(parents=True, exist_ok=True)
-    init_db()
-    logging.info("Serving the main PDF QA FastHTML app...")
-    return pdf_qa_fasthtml_app
+            error_app, error_rt = fh.fast_app()
+
+            @error_rt("/")
+            def error_route():
+                return fh.H1("Error: Application failed to load.")
+
+            return error_app
+
+        return pdf_qa_fasthtml_app
 
 
 @app.local_entrypoint()
@@ -136,11 +246,7 @@ def main():
     logger.info("Deployment script for main.py app defined.")
     if pdf_qa_fasthtml_app:
         logger.info("FastHTML app from main.py imported successfully.")
-        try:
-            serve_func_name = serve_main_app.info.name
-            print(f"To run locally: modal serve deploy.py::{serve_func_name}")
-        except Exception:
-            print("To run locally: modal serve deploy.py::serve_main_app")
+        print("To run locally: modal serve deploy.py::MainApp.serve_main_app")
     else:
         logger.error("Could not import FastHTML app from main.py.")
 
@@ -0,0 +1,105 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+_tasks = {}
+_broadcasts = {}
+
+
+def is_running(key):
+    return key in _tasks or key in _broadcasts
+
+
+async def run_once(key, coro_fn, *args):
+    """Awaits coro_fn(*args), sharing one run among concurrent callers with the same key.
+
+    The shared task is shielded so a caller that goes away doesn't cancel it for
+    the others.
+    """
+    task = _tasks.get(key)
+    if task is None:
+        task = asyncio.create_task(coro_fn(*args))
+        _tasks[key] = task
+        task.add_done_callback(lambda _: _tasks.pop(key, None))
+    return await asyncio.shield(task)
+
+
+class Broadcast:
+    """Fans chunks from one producer out to every subscriber.
+
+    Subscribers that join late are first sent the chunks they missed.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self._queues = set()
+
+    def publish(self, chunk):
+        self.chunks.append(chunk)
+        for queue in self._queues:
+            queue.put_nowait(chunk)
+
+    def close(self):
+        self.done = True
+        for queue in self._queues:
+            queue.put_nowait(None)
+
+    async def subscribe(self, batch_seconds=0, batch_chars=0):
+        """Yields published chunks, joining those that arrive close together.
+
+        After the first chunk of a batch, waits up to `batch_seconds` for more
+        until the batch holds at least `batch_chars` characters.
+        """
+        queue = asyncio.Queue()
+        for chunk in self.chunks:
+            queue.put_nowait(chunk)
+        if self.done:
+            queue.put_nowait(None)
+        else:
+            self._queues.add(queue)
+        loop = asyncio.get_running_loop()
+        try:
+            while (chunk := await queue.get()) is not None:
+                batch, size = [chunk], len(chunk)
+                deadline = loop.time() + batch_seconds
+                while size < batch_chars:
+                    try:
+                        chunk = await asyncio.wait_for(
+                            queue.get(), max(deadline - loop.time(), 0)
+                        )
+                    except TimeoutError:
+                        break
+                    if chunk is None:
+                        queue.put_nowait(None)
+                        break
+                    batch.append(chunk)
+                    size += len(chunk)
+                yield "".join(batch)
+        finally:
+            self._queues.discard(queue)
+
+
+def broadcast_once(key, produce, *args):
+    """Returns the in-flight broadcast for key, starting produce(broadcast, *args) if needed.
+
+    The producer runs as its own task, so it finishes even if every subscriber
+    disconnects.
+    """
+    broadcast = _broadcasts.get(key)
+    if broadcast is None:
+        broadcast = Broadcast()
+        _broadcasts[key] = broadcast
+        broadcast.task = asyncio.create_task(_produce(key, broadcast, produce, args))
+    return broadcast
+
+
+async def _produce(key, broadcast, produce, args):
+    try:
+        await produce(broadcast, *args)
+    except Exception:
+        logger.exception("Producer for in-flight key %s failed", key)
+    finally:
+        _broadcasts.pop(key, None)
+        broadcast.close()
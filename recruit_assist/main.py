@@ -1,21 +1,73 @@
 import asyncio
-from datetime import datetime
+import contextlib
+from datetime import datetime, timedelta
+import functools
 import hashlib
+import html
 import logging
 import sqlite3
-import urllib
+import urllib.parse
 import uuid
 
 import fasthtml.common as fh
 from google import genai
-import fitz
-
-from recruit_assist.constants import DB_FILE
+from google.genai import types
+from starlette.middleware.gzip import GZipMiddleware
+
+from recruit_assist import db, inflight
+from recruit_assist.answer_cache import (
+    add_semantic_entry,
+    answer_cache_key,
+    cache_answer,
+    find_similar_answer_key,
+    get_cached_answer,
+    has_semantic_entries,
+    normalize_embedding,
+)
+from recruit_assist.constants import (
+    CONTEXT_CACHE_MIN_CHARS,
+    CONTEXT_CACHE_TTL_SECONDS,
+    EMBEDDING_MODEL,
+    PDF_TEXT_CACHE_SIZE,
+    RETRIEVAL_CHUNK_CHARS,
+    RETRIEVAL_MIN_CHARS,
+    RETRIEVAL_TOP_K,
+    SSE_BATCH_CHARS,
+    SSE_BATCH_SECONDS,
+)
+from recruit_assist.pdf import (
+    compress_text,
+    decompress_text,
+    extract_text,
+    read_upload,
+)
+from recruit_assist.retrieval import chunk_text, has_chunks, store_chunks, top_chunks
 
 # Supports streaming model responses
 SSE_HDR = fh.Script(src="https://unpkg.com/htmx-ext-sse@2.2.2/sse.js")
 
-app, rt = fh.fast_app(hdrs=(SSE_HDR,))
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    """Runs the interaction log writer for as long as the app is serving."""
+    global _interaction_queue
+    queue = asyncio.Queue()
+    writer = asyncio.create_task(write_interaction_batches(queue))
+    _interaction_queue = queue
+    try:
+        yield
+    finally:
+        _interaction_queue = None
+        await queue.join()
+        writer.cancel()
+
+
+app, rt = fh.fast_app(
+    hdrs=(SSE_HDR,),
+    lifespan=lifespan,
+    # Starlette leaves text/event-stream uncompressed so answers still stream
+    middleware=[fh.Middleware(GZipMiddleware, minimum_size=256)],
+)
 
 STYLE = fh.Style("""
     .htmx-indicator{
@@ -30,27 +82,82 @@ STYLE = fh.Style("""
     }
 """)
 
+# Hashes the chosen PDF in the browser and only uploads it if the server
+# doesn't already have it. Falls back to a normal upload on any failure.
+SKIP_KNOWN_UPLOAD_SCRIPT = fh.Script("""
+document.addEventListener("htmx:confirm", async (event) => {
+    const form = event.detail.elt;
+    if (form.id !== "upload-form" || !window.crypto?.subtle) return;
+    const file = form.elements.pdf_file.files[0];
+    if (!file) return;
+    event.preventDefault();
+    try {
+        const digest = await crypto.subtle.digest("SHA-256", await file.arrayBuffer());
+        const sha256 = Array.from(new Uint8Array(digest), (b) =>
+            b.toString(16).padStart(2, "0")
+        ).join("");
+        const params = new URLSearchParams({sha256, filename: file.name, size: file.size});
+        const response = await fetch(`/pdf-exists?${params}`, {headers: {"HX-Request": "true"}});
+        if (response.ok) {
+            const result = document.getElementById("result");
+            result.innerHTML = await response.text();
+            htmx.process(result);
+            return;
+        }
+    } catch (error) {
+        console.warn("PDF lookup failed, uploading instead", error);
+    }
+    event.detail.issueRequest(true);
+});
+""")
+
 logger = logging.getLogger(__name__)
 
+MODEL = "gemini-2.0-flash"
+LLM_ERROR_MESSAGE = "Error during LLM generation"
+# Cached answers are replayed in slices so the client still sees a stream
+CACHED_ANSWER_SLICE_CHARS = 256
+# Pre-encoded SSE framing for the answer stream
+SSE_MESSAGE_START = b"event: message\ndata: "
+SSE_MESSAGE_END = b"\n\n"
+SSE_CLOSE = b"event: close\ndata: \n\n"
+INTERACTION_LOG_BATCH_SIZE = 128
+INSERT_INTERACTION_SQL = "INSERT INTO interactions VALUES (?, ?, ?, ?, ?)"
+# Gemini accepts at most 100 texts per embedding request
+EMBEDDING_BATCH_SIZE = 100
+
+# Rows waiting for the background writer; None when the writer isn't running
+_interaction_queue = None
 
+
+@functools.lru_cache(maxsize=1)
 def get_model_client():
+    """Returns the process-wide Gemini client, reusing its connections."""
     return genai.Client()
 
 
-@rt("/")
-def get():
-    return fh.Titled(
+@functools.cache
+def render_upload_page():
+    """Renders the static page content once; fasthtml still adds the page wrapper."""
+    title, page = fh.Titled(
         "Ask AI about a PDF",
         fh.Article(
             fh.H3("Upload a PDF"),
-            fh.Form(hx_post=upload_pdf, hx_target="#result")(
+            fh.Form(hx_post=upload_pdf, hx_target="#result", id="upload-form")(
                 fh.Input(type="file", name="pdf_file", accept="application/pdf"),
                 fh.Button("Upload PDF", type="submit", cls="primary"),
                 fh.Span("Uploading...", id="upload-indicator", cls="htmx-indicator"),
             ),
             fh.Div(id="result"),
         ),
+        SKIP_KNOWN_UPLOAD_SCRIPT,
     )
+    return title, fh.NotStr(fh.to_xml(page))
+
+
+@rt("/")
+def get():
+    return render_upload_page()
 
 
 @rt
@@ -58,45 +165,70 @@ async def upload_pdf(pdf_file: fh.UploadFile):
     if not pdf_file or pdf_file.content_type != "application/pdf":
         return fh.P("Please upload a valid PDF file", role="alert")
 
-    pdf_binary = await pdf_file.read()
-
-    pdf_hash = hashlib.sha256(pdf_binary).digest()
-    pdf_id = str(uuid.UUID(bytes=pdf_hash[:16]))
+    pdf_id = await asyncio.to_thread(pdf_id_for, pdf_file.file)
     logger.info("Generated PDF ID %s", pdf_id)
 
+    context_cache_task = None
     try:
-        conn = sqlite3.connect(DB_FILE)
-        c = conn.cursor()
-
-        c.execute("SELECT 1 FROM pdfs WHERE id = ?", (pdf_id,))
-        exists = c.fetchone()
-
-        if exists:
+        if await asyncio.to_thread(pdf_exists, pdf_id):
             logger.info("Cache hit: Found existing text for PDF ID %s in DB", pdf_id)
         else:
             logger.info("Cache miss: Extracting text for new PDF ID %s", pdf_id)
-            c.execute(
-                "INSERT INTO pdfs (id, filename, text) VALUES (?, ?, ?)",
-                (pdf_id, pdf_file.filename, extract_text_from_pdf(pdf_binary)),
-            )
-            conn.commit()
-            logger.info("Stored newly extracted PDF text with ID %s in DB", pdf_id)
+            # Concurrent uploads of the same PDF wait for a single extraction
+            ingest_key = ("ingest", pdf_id)
+            started_ingest = not inflight.is_running(ingest_key)
+            pdf_text = await inflight.run_once(ingest_key, ingest_pdf, pdf_id, pdf_file)
+            if started_ingest and len(pdf_text) >= RETRIEVAL_MIN_CHARS:
+                # Index large documents so questions only send relevant chunks
+                context_cache_task = fh.BackgroundTask(
+                    inflight.run_once,
+                    ("chunk-index", pdf_id),
+                    index_pdf_chunks,
+                    pdf_id,
+                    pdf_text,
+                )
+            elif started_ingest:
+                # Upload the text to Gemini after responding so questions reuse it
+                context_cache_task = fh.BackgroundTask(
+                    inflight.run_once,
+                    ("context-cache", pdf_id),
+                    create_context_cache,
+                    pdf_id,
+                    pdf_text,
+                )
     except sqlite3.Error as e:
         logger.error("SQLite error during PDF upload/check for ID %s: %s", pdf_id, e)
-        conn.rollback()
         return fh.P("Error processing PDF", role="alert")
-    finally:
-        if conn:
-            conn.close()
 
+    return question_form(pdf_id, pdf_file.filename, pdf_file.size), context_cache_task
+
+
+@rt("/pdf-exists")
+async def known_pdf(sha256: str, filename: str, size: int):
+    """Returns the question form if the PDF with this SHA-256 is already stored."""
+    try:
+        pdf_id = pdf_id_from_digest(bytes.fromhex(sha256))
+    except ValueError:
+        return fh.Response("Invalid SHA-256 digest", status_code=400)
+    try:
+        exists = await asyncio.to_thread(pdf_exists, pdf_id)
+    except sqlite3.Error as e:
+        logger.error("SQLite error checking for PDF ID %s: %s", pdf_id, e)
+        exists = False
+    if not exists:
+        return fh.Response(status_code=404)
+    logger.info("Client-side hash matched stored PDF ID %s", pdf_id)
+    return question_form(pdf_id, filename, size)
+
+
+def question_form(pdf_id, pdf_filename, size):
     return fh.Article(
-        fh.H3(f"PDF Uploaded: {pdf_file.filename}"),
-        fh.P(f"Size: {len(pdf_binary)} bytes"),
+        fh.H3(f"PDF Uploaded: {pdf_filename}"),
+        fh.P(f"Size: {size} bytes"),
         fh.Hr(),
         fh.H3("Ask questions about this PDF:"),
         fh.Form(hx_post=answer_question, hx_target="#answers")(
             fh.Hidden(value=pdf_id, name="pdf_id"),
-            fh.Hidden(value=pdf_file.filename, name="pdf_filename"),
             fh.Textarea(
                 name="query",
                 placeholder="Ask a question about the PDF...",
@@ -110,137 +242,456 @@ async def upload_pdf(pdf_file: fh.UploadFile):
     )
 
 
-def extract_text_from_pdf(pdf_bytes: bytes) -> str:
-    pdf_doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-    return "".join(
-        pdf_doc.load_page(page_num).get_text("text")
-        for page_num in range(pdf_doc.page_count)
-    )
+async def ingest_pdf(pdf_id, pdf_file):
+    with read_upload(pdf_file.file) as pdf_bytes:
+        pdf_text = await extract_text(pdf_bytes)
+    await asyncio.to_thread(store_pdf, pdf_id, pdf_file.filename, pdf_text)
+    logger.info("Stored newly extracted PDF text with ID %s in DB", pdf_id)
+    return pdf_text
+
+
+def pdf_id_for(pdf_fileobj) -> str:
+    """Derives a stable ID from the file's SHA-256 without reading it into memory."""
+    pdf_fileobj.seek(0)
+    return pdf_id_from_digest(hashlib.file_digest(pdf_fileobj, "sha256").digest())
+
+
+def pdf_id_from_digest(pdf_hash: bytes) -> str:
+    if len(pdf_hash) != hashlib.sha256().digest_size:
+        raise ValueError("Expected a SHA-256 digest")
+    return str(uuid.UUID(bytes=pdf_hash[:16]))
 
 
 @rt
-async def answer_question(pdf_id: str, pdf_filename: str, query: str):
-    encoded_query = urllib.parse.quote(query)
-    encoded_pdf_id = urllib.parse.quote(pdf_id)
-    encoded_pdf_filename = urllib.parse.quote(pdf_filename)
+async def answer_question(pdf_id: str, query: str):
+    params = urllib.parse.urlencode(
+        {"query": query, "pdf_id": pdf_id}, quote_via=urllib.parse.quote
+    )
+    sse_url = f"/answer-stream?{params}"
+
+    return fh.NotStr(
+        ANSWER_TEMPLATE % {"query": html.escape(query), "sse_url": html.escape(sse_url)}
+    )
 
-    sse_url = f"/answer-stream?query={encoded_query}&pdf_id={encoded_pdf_id}&pdf_filename={encoded_pdf_filename}"
 
-    return fh.Div(
+# Rendered once with %-placeholders; the markup itself must not contain "%"
+ANSWER_TEMPLATE = fh.to_xml(
+    fh.Div(
         fh.H4("Question:"),
-        fh.P(query),
+        fh.P("%(query)s"),
         fh.H4("Answer:"),
         fh.Div(
             id="answer-content",
             hx_ext="sse",
-            sse_connect=sse_url,
+            sse_connect="%(sse_url)s",
             sse_swap="message",
             sse_close="close",
             hx_swap="beforeend",
         ),
     )
+)
 
 
 @rt("/answer-stream")
-async def answer_stream(query: str, pdf_id: str, pdf_filename: str):
-    accumulated_response_for_log = ""
-
+async def answer_stream(query: str, pdf_id: str):
     async def event_generator():
-        nonlocal accumulated_response_for_log
-        pdf_text = None
-        conn = None
-        try:
-            conn = sqlite3.connect(DB_FILE)
-            c = conn.cursor()
-            c.execute("SELECT text FROM pdfs WHERE id = ?", (pdf_id,))
-            result = c.fetchone()
-
-            if result:
-                pdf_text = result[0]
-                logger.info("Retrieved PDF text from DB for ID: %s", pdf_id)
-            else:
-                logger.error("PDF text not found in DB for ID: %s", pdf_id)
-                yield fh.sse_error(
-                    "Error: Could not find PDF text associated with this session in the database."
+        cache_key = answer_cache_key(pdf_id, query)
+        answer_key = ("answer", cache_key)
+        cached_response = await asyncio.to_thread(get_cached_answer, cache_key)
+        query_embedding = None
+        if cached_response is None and not inflight.is_running(answer_key):
+            # The embedding is needed to index the new answer even when there is
+            # nothing to compare it with yet, so only wait for it here if there is
+            query_embedding = asyncio.create_task(embed_query(query))
+            embedding = None
+            if await asyncio.to_thread(has_semantic_entries, pdf_id):
+                embedding = await query_embedding
+            if embedding is not None:
+                similar_key = await asyncio.to_thread(
+                    find_similar_answer_key, pdf_id, embedding
+                )
+                if similar_key is not None:
+                    cached_response = await asyncio.to_thread(
+                        get_cached_answer, similar_key
+                    )
+        if cached_response is not None:
+            logger.info("Answer cache hit for PDF ID %s", pdf_id)
+            for start in range(0, len(cached_response), CACHED_ANSWER_SLICE_CHARS):
+                yield sse_message(
+                    cached_response[start : start + CACHED_ANSWER_SLICE_CHARS]
                 )
-                return
-        except sqlite3.Error as e:
-            logger.error("SQLite error retrieving text for ID %s: %s", pdf_id, e)
-            yield fh.sse_error("Error retrieving PDF text from database")
-            return  # Exit generation on DB error
+                await asyncio.sleep(0)
+            await log_interaction(pdf_id, query, cached_response)
+            yield SSE_CLOSE
+            return
+
+        # Identical questions asked while this one is streaming share its answer
+        broadcast = inflight.broadcast_once(
+            answer_key, produce_answer, cache_key, pdf_id, query, query_embedding
+        )
+        accumulated_response_for_log = ""
+        try:
+            async for chunk in broadcast.subscribe(SSE_BATCH_SECONDS, SSE_BATCH_CHARS):
+                accumulated_response_for_log += chunk
+                yield sse_message(chunk)
         finally:
-            if conn is not None:
-                conn.close()
+            if accumulated_response_for_log:
+                if not accumulated_response_for_log.endswith(
+                    LLM_ERROR_MESSAGE
+                ) and not accumulated_response_for_log.startswith("Error:"):
+                    await log_interaction(pdf_id, query, accumulated_response_for_log)
+        yield SSE_CLOSE
 
-        if pdf_text is not None:
-            try:
-                async for chunk in get_answer(query, pdf_text):
-                    if chunk:
-                        accumulated_response_for_log += chunk
-                        yield fh.sse_message(chunk)
-                        await asyncio.sleep(0.01)
-                    else:
-                        logger.warning("Received empty chunk, skipping.")
-            finally:
-                if accumulated_response_for_log:
-                    if not accumulated_response_for_log.startswith(
-                        "Error during LLM generation:"
-                    ) and not accumulated_response_for_log.startswith("Error:"):
-                        log_interaction(pdf_id, query, accumulated_response_for_log)
-                yield "event: close\ndata: \n\n"
+    return fh.EventStream(event_generator())
+
+
+def sse_message(text):
+    """Frames text as an SSE message event, escaped for HTML like fh.sse_message.
+
+    The client swaps each event into the page as HTML, so answer text must not
+    be able to inject markup.
+    """
+    text = html.escape(text, quote=False)
+    data = text.replace("\r\n", "\n").replace("\r", "\n").encode("utf-8")
+    return SSE_MESSAGE_START + data.replace(b"\n", b"\ndata: ") + SSE_MESSAGE_END
+
+
+async def produce_answer(broadcast, cache_key, pdf_id, query, query_embedding):
+    """Streams a Gemini answer into `broadcast` and caches it once complete.
+
+    `query_embedding` is a task that resolves to the question's embedding, or None.
+    """
+    try:
+        result = await asyncio.to_thread(load_pdf, pdf_id)
+    except sqlite3.Error as e:
+        logger.error("SQLite error retrieving text for ID %s: %s", pdf_id, e)
+        broadcast.publish("Error: Could not retrieve PDF text from the database.")
+        return
+
+    if not result or result[0] is None:
+        logger.error("PDF text not found in DB for ID: %s", pdf_id)
+        broadcast.publish(
+            "Error: Could not find PDF text associated with this session in the database."
+        )
+        return
+    pdf_text, cache_name, cache_expires_at = result
+    logger.info("Retrieved PDF text from DB for ID: %s", pdf_id)
+
+    context = None
+    if len(pdf_text) >= RETRIEVAL_MIN_CHARS:
+        context = await retrieve_context(pdf_id, pdf_text, query)
+    if context is not None:
+        answer_chunks = get_answer(query, context)
+    else:
+        cache_name = await inflight.run_once(
+            ("context-cache", pdf_id),
+            ensure_context_cache,
+            pdf_id,
+            pdf_text,
+            cache_name,
+            cache_expires_at,
+        )
+        answer_chunks = get_answer(query, pdf_text, cache_name)
+    response = ""
+    async for chunk in answer_chunks:
+        if chunk:
+            response += chunk
+            broadcast.publish(chunk)
         else:
-            yield "event: close\ndata: \n\n"
+            logger.warning("Received empty chunk, skipping.")
+
+    if response and not response.endswith(LLM_ERROR_MESSAGE):
+        await asyncio.to_thread(cache_answer, cache_key, response)
+        embedding = await query_embedding if query_embedding is not None else None
+        if embedding is not None:
+            await asyncio.to_thread(add_semantic_entry, pdf_id, embedding, cache_key)
 
-    return fh.EventStream(event_generator())
 
+async def embed_query(query):
+    try:
+        response = await get_model_client().aio.models.embed_content(
+            model=EMBEDDING_MODEL,
+            contents=query,
+            config=types.EmbedContentConfig(task_type="SEMANTIC_SIMILARITY"),
+        )
+    except Exception as e:
+        logger.error("Error embedding query for semantic cache: %s", e)
+        return None
+    return normalize_embedding(response.embeddings[0].values)
+
+
+async def embed_texts(texts, task_type):
+    """Embeds texts with Gemini in batches, returning normalized vectors."""
+    model_client = get_model_client()
+    embeddings = []
+    for start in range(0, len(texts), EMBEDDING_BATCH_SIZE):
+        response = await model_client.aio.models.embed_content(
+            model=EMBEDDING_MODEL,
+            contents=texts[start : start + EMBEDDING_BATCH_SIZE],
+            config=types.EmbedContentConfig(task_type=task_type),
+        )
+        embeddings.extend(normalize_embedding(e.values) for e in response.embeddings)
+    return embeddings
+
+
+async def index_pdf_chunks(pdf_id, pdf_text):
+    """Embeds the PDF in chunks so questions can be answered from the relevant ones."""
+    chunks = chunk_text(pdf_text, RETRIEVAL_CHUNK_CHARS)
+    try:
+        embeddings = await embed_texts(chunks, "RETRIEVAL_DOCUMENT")
+    except Exception as e:
+        logger.error("Error embedding chunks for PDF ID %s: %s", pdf_id, e)
+        return
+    await asyncio.to_thread(store_chunks, pdf_id, chunks, embeddings)
 
-async def get_answer(query, pdf_text):
+
+async def retrieve_context(pdf_id, pdf_text, query):
+    """Returns the PDF chunks most relevant to the query, or None if unavailable."""
+    if not await asyncio.to_thread(has_chunks, pdf_id):
+        await inflight.run_once(
+            ("chunk-index", pdf_id), index_pdf_chunks, pdf_id, pdf_text
+        )
+        if not await asyncio.to_thread(has_chunks, pdf_id):
+            return None
+    try:
+        (query_embedding,) = await embed_texts([query], "RETRIEVAL_QUERY")
+    except Exception as e:
+        logger.error("Error embedding query for retrieval: %s", e)
+        return None
+    chunks = await asyncio.to_thread(
+        top_chunks, pdf_id, query_embedding, RETRIEVAL_TOP_K
+    )
+    logger.info("Answering from %d chunks of PDF ID %s", len(chunks), pdf_id)
+    return "\n\n".join(chunks) or None
+
+
+async def create_context_cache(pdf_id, pdf_text):
+    """Uploads the PDF text to Gemini once so later questions only send the query."""
+    if len(pdf_text) < CONTEXT_CACHE_MIN_CHARS:
+        # Gemini rejects caches below its minimum size, so don't ask on every question
+        return None
+    try:
+        cache = await get_model_client().aio.caches.create(
+            model=MODEL,
+            config=types.CreateCachedContentConfig(
+                contents=create_document_prompt(pdf_text),
+                ttl=f"{CONTEXT_CACHE_TTL_SECONDS}s",
+            ),
+        )
+    except Exception as e:
+        logger.warning("Could not create context cache for PDF ID %s: %s", pdf_id, e)
+        return None
+    expires_at = datetime.now() + timedelta(seconds=CONTEXT_CACHE_TTL_SECONDS)
+    await asyncio.to_thread(store_context_cache, pdf_id, cache.name, expires_at)
+    logger.info("Created context cache %s for PDF ID %s", cache.name, pdf_id)
+    return cache.name
+
+
+async def ensure_context_cache(pdf_id, pdf_text, cache_name, cache_expires_at):
+    """Returns a live context cache for the PDF, extending or recreating it as needed."""
+    now = datetime.now()
+    if cache_name is None or cache_expires_at <= now.isoformat():
+        return await create_context_cache(pdf_id, pdf_text)
+    refresh_after = now + timedelta(seconds=CONTEXT_CACHE_TTL_SECONDS / 2)
+    if cache_expires_at < refresh_after.isoformat():
+        try:
+            await get_model_client().aio.caches.update(
+                name=cache_name,
+                config=types.UpdateCachedContentConfig(
+                    ttl=f"{CONTEXT_CACHE_TTL_SECONDS}s"
+                ),
+            )
+        except Exception as e:
+            logger.warning("Could not refresh context cache %s: %s", cache_name, e)
+            return await create_context_cache(pdf_id, pdf_text)
+        expires_at = now + timedelta(seconds=CONTEXT_CACHE_TTL_SECONDS)
+        await asyncio.to_thread(store_context_cache, pdf_id, cache_name, expires_at)
+    return cache_name
+
+
+def pdf_exists(pdf_id):
+    with db.connection() as conn:
+        return (
+            conn.execute("SELECT 1 FROM pdfs WHERE id = ?", (pdf_id,)).fetchone()
+            is not None
+        )
+
+
+def store_pdf(pdf_id, filename, pdf_text):
+    text_z = compress_text(pdf_text)
+    with db.connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT OR IGNORE INTO pdfs (id, filename) VALUES (?, ?)",
+                (pdf_id, filename),
+            )
+            conn.execute(
+                "INSERT OR IGNORE INTO pdf_text (id, text_z) VALUES (?, ?)",
+                (pdf_id, text_z),
+            )
+        except sqlite3.Error:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+
+def load_pdf(pdf_id):
+    """Returns (text, cache_name, cache_expires_at) for the PDF, or None."""
+    with db.connection() as conn:
+        row = conn.execute(
+            "SELECT cache_name, cache_expires_at FROM pdfs WHERE id = ?", (pdf_id,)
+        ).fetchone()
+    if row is None:
+        return None
+    cache_name, cache_expires_at = row
+    return load_pdf_text(pdf_id), cache_name, cache_expires_at
+
+
+# A PDF's ID is its content hash, so its text never changes once stored
+@functools.lru_cache(maxsize=PDF_TEXT_CACHE_SIZE)
+def load_pdf_text(pdf_id):
+    with db.connection() as conn:
+        row = conn.execute(
+            "SELECT pdfs.text, pdf_text.text_z"
+            " FROM pdfs LEFT JOIN pdf_text USING (id) WHERE id = ?",
+            (pdf_id,),
+        ).fetchone()
+    if row is None:
+        return None
+    pdf_text, text_z = row
+    if text_z is not None:
+        return decompress_text(text_z)
+    if pdf_text is not None:
+        # Rows stored before compression are migrated the first time they're read
+        text_z = compress_text(pdf_text)
+        with db.connection() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO pdf_text (id, text_z) VALUES (?, ?)",
+                (pdf_id, text_z),
+            )
+            conn.execute("UPDATE pdfs SET text = NULL WHERE id = ?", (pdf_id,))
+        logger.info("Compressed stored text for PDF ID %s", pdf_id)
+    return pdf_text
+
+
+def store_context_cache(pdf_id, cache_name, expires_at):
+    try:
+        with db.connection() as conn:
+            conn.execute(
+                "UPDATE pdfs SET cache_name = ?, cache_expires_at = ? WHERE id = ?",
+                (cache_name, expires_at.isoformat(), pdf_id),
+            )
+    except sqlite3.Error as e:
+        logger.error("SQLite error storing context cache for PDF ID %s: %s", pdf_id, e)
+
+
+def forget_context_cache(cache_name):
+    try:
+        with db.connection() as conn:
+            conn.execute(
+                "UPDATE pdfs SET cache_name = NULL, cache_expires_at = NULL"
+                " WHERE cache_name = ?",
+                (cache_name,),
+            )
+    except sqlite3.Error as e:
+        logger.error("SQLite error forgetting context cache %s: %s", cache_name, e)
+
+
+async def get_answer(query, pdf_text, cache_name=None):
     logger.info("Inside get_answer")
+    received_text = False
     try:
         model_client = get_model_client()
-        response_stream = model_client.models.generate_content_stream(
-            model="gemini-2.0-flash",
-            contents=create_prompt(query, pdf_text),
-        )
+        if cache_name is not None:
+            response_stream = await model_client.aio.models.generate_content_stream(
+                model=MODEL,
+                contents=create_question_prompt(query),
+                config=types.GenerateContentConfig(cached_content=cache_name),
+            )
+        else:
+            response_stream = await model_client.aio.models.generate_content_stream(
+                model=MODEL,
+                contents=create_prompt(query, pdf_text),
+            )
         logger.info("Got response_stream object")
-        for chunk in response_stream:
+        async for chunk in response_stream:
             logger.info(f"Processing chunk in get_answer: {hasattr(chunk, 'text')}")
             if hasattr(chunk, "text") and chunk.text:
+                received_text = True
                 yield chunk.text
             else:
                 logger.warning("Chunk received without text or empty text.")
 
     except Exception as e:
+        if cache_name is not None and not received_text:
+            logger.warning(
+                "Context cache %s failed, retrying with the full prompt: %s",
+                cache_name,
+                e,
+            )
+            # The cache was likely evicted, so have the next question recreate it
+            await asyncio.to_thread(forget_context_cache, cache_name)
+            async for text in get_answer(query, pdf_text):
+                yield text
+            return
         logger.error("!!! Error during LLM call in get_answer: %s", e, exc_info=True)
-        yield "Error during LLM generation"
-
+        yield LLM_ERROR_MESSAGE
 
-def create_prompt(query, pdf_text):
-    return f"""
-    The following is content from a PDF document: 
-    {pdf_text}
 
-    User's question about this document: {query}
+# Prompts are sent as a list of text parts so the document is never copied
+# into a new string just to wrap it in instructions
+DOCUMENT_PROMPT_START = "\n    The following is content from a PDF document: \n    "
+DOCUMENT_PROMPT_END = "\n"
+QUESTION_PROMPT_START = "\n    User's question about this document: "
+QUESTION_PROMPT_END = """
 
     Please provide a clear and concise answer based only on the document content.
     """
 
 
-def log_interaction(pdf_id, query, response):
+def create_document_prompt(pdf_text):
+    return [DOCUMENT_PROMPT_START, pdf_text, DOCUMENT_PROMPT_END]
+
+
+def create_question_prompt(query):
+    return [QUESTION_PROMPT_START, query, QUESTION_PROMPT_END]
+
+
+def create_prompt(query, pdf_text):
+    return create_document_prompt(pdf_text) + create_question_prompt(query)
+
+
+async def log_interaction(pdf_id, query, response):
+    interaction_id = uuid.uuid4().hex
+    timestamp = datetime.now().isoformat()
+    row = (interaction_id, timestamp, pdf_id, query, response)
+    if _interaction_queue is not None:
+        _interaction_queue.put_nowait(row)
+    else:
+        await asyncio.to_thread(write_interactions, [row])
+
+
+async def write_interaction_batches(queue):
+    """Drains queued interactions, writing up to a batch of rows per transaction."""
+    while True:
+        rows = [await queue.get()]
+        while len(rows) < INTERACTION_LOG_BATCH_SIZE and not queue.empty():
+            rows.append(queue.get_nowait())
+        await asyncio.to_thread(write_interactions, rows)
+        for _ in rows:
+            queue.task_done()
+
+
+def write_interactions(rows):
     try:
-        conn = sqlite3.connect(DB_FILE)
-        c = conn.cursor()
-        interaction_id = str(uuid.uuid4())
-        timestamp = datetime.now().isoformat()
-        c.execute(
-            "INSERT INTO interactions VALUES (?, ?, ?, ?, ?)",
-            (interaction_id, timestamp, pdf_id, query, response),
-        )
-        conn.commit()
+        with db.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(INSERT_INTERACTION_SQL, rows)
+            except sqlite3.Error:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
     except sqlite3.Error as e:
-        logger.error("SQLite error logging interaction for PDF ID %s: %s", pdf_id, e)
-        if conn:
-            conn.rollback()  # Rollback on error
-    finally:
-        if conn:
-            conn.close()
+        logger.error("SQLite error logging %d interactions: %s", len(rows), e)
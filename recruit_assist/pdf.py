@@ -0,0 +1,95 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+import contextlib
+import functools
+import math
+import mmap
+import multiprocessing
+import os
+import zlib
+
+import fitz
+
+from recruit_assist.constants import PDF_PARALLEL_MIN_PAGES, PDF_TEXT_ZLIB_LEVEL
+
+# PyMuPDF documents can't be shared between threads, so pages are split across
+# processes. More than 8 rarely pays off against the cost of copying the PDF.
+PDF_WORKERS = int(os.environ.get("PDF_WORKERS", min(8, os.process_cpu_count() or 1)))
+# Bitmask of fitz.TEXT_* flags; the default matches get_text("text")
+PDF_TEXT_FLAGS = int(os.environ.get("PDF_TEXT_FLAGS", fitz.TEXTFLAGS_TEXT))
+
+
+@functools.lru_cache(maxsize=1)
+def get_process_pool():
+    # Spawned workers import only this module, and avoid forking a threaded server
+    return ProcessPoolExecutor(
+        max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context("spawn")
+    )
+
+
+@contextlib.contextmanager
+def read_upload(fileobj):
+    """Yields the upload's contents, memory-mapped if it was spooled to disk.
+
+    Starlette keeps uploads under 1 MB in memory, where there is no file to map.
+    """
+    if not getattr(fileobj, "_rolled", True):
+        fileobj.seek(0)
+        yield fileobj.read()
+        return
+    with mmap.mmap(fileobj.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        with memoryview(mapped) as view:
+            yield view
+
+
+def get_page_count(pdf_bytes: bytes) -> int:
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as pdf_doc:
+        return pdf_doc.page_count
+
+
+def extract_text_from_pdf(pdf_bytes: bytes, start: int = 0, end: int | None = None):
+    """Extracts the text of pages [start, end) in page order."""
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as pdf_doc:
+        end = pdf_doc.page_count if end is None else end
+        # A list lets join size the result in one pass instead of first
+        # materializing the generator itself
+        return "".join(
+            [
+                pdf_doc.load_page(page_num).get_text("text", flags=PDF_TEXT_FLAGS)
+                for page_num in range(start, end)
+            ]
+        )
+
+
+async def extract_text(pdf_bytes: bytes) -> str:
+    """Extracts text off the event loop, splitting large PDFs across processes."""
+    page_count = await asyncio.to_thread(get_page_count, pdf_bytes)
+    if PDF_WORKERS == 1 or page_count < PDF_PARALLEL_MIN_PAGES:
+        return await asyncio.to_thread(extract_text_from_pdf, pdf_bytes)
+
+    loop = asyncio.get_running_loop()
+    pool = get_process_pool()
+    # Worker processes are sent a pickled copy, which a memory map can't provide
+    pdf_bytes = bytes(pdf_bytes)
+    shard_size = math.ceil(page_count / PDF_WORKERS)
+    shards = await asyncio.gather(
+        *(
+            loop.run_in_executor(
+                pool,
+                extract_text_from_pdf,
+                pdf_bytes,
+                start,
+                min(start + shard_size, page_count),
+            )
+            for start in range(0, page_count, shard_size)
+        )
+    )
+    return "".join(shards)
+
+
+def compress_text(pdf_text: str) -> bytes:
+    return zlib.compress(pdf_text.encode("utf-8"), PDF_TEXT_ZLIB_LEVEL)
+
+
+def decompress_text(text_z: bytes) -> str:
+    return zlib.decompress(text_z).decode("utf-8")
@@ -0,0 +1,190 @@
+from array import array
+import functools
+import heapq
+import logging
+import math
+import mmap
+import os
+from pathlib import Path
+import re
+import sqlite3
+import uuid
+
+from recruit_assist import db
+
+logger = logging.getLogger(__name__)
+
+FLOAT_BYTES = array("f").itemsize
+
+# Progressively finer places to split text that is too long for one chunk:
+# after sentences, then after lines, then after words. Separators stay attached
+# so the pieces join back into the original text.
+SPLIT_POINTS = (
+    re.compile(r"(?<=[.!?]\s)"),
+    re.compile(r"(?<=\n)"),
+    re.compile(r"(?<=\s)"),
+)
+
+
+def _split(text, chunk_chars, split_points=SPLIT_POINTS):
+    """Splits text into pieces of at most `chunk_chars`, at the coarsest points possible."""
+    if len(text) <= chunk_chars:
+        return [text]
+    if not split_points:
+        return [text[i : i + chunk_chars] for i in range(0, len(text), chunk_chars)]
+    return [
+        piece
+        for part in split_points[0].split(text)
+        if part
+        for piece in _split(part, chunk_chars, split_points[1:])
+    ]
+
+
+def chunk_text(text, chunk_chars):
+    """Splits text into chunks of at most `chunk_chars` characters.
+
+    Chunks hold whole sentences where they fit, falling back to lines, words
+    and finally hard cuts. Consecutive chunks overlap by one piece when it fits,
+    so an answer that straddles a boundary is still found in one piece.
+    """
+    chunks, pieces, size = [], [], 0
+    for piece in _split(text, chunk_chars):
+        if pieces and size + len(piece) > chunk_chars:
+            chunks.append("".join(pieces))
+            overlap = pieces[-1]
+            if len(overlap) + len(piece) <= chunk_chars:
+                pieces, size = [overlap], len(overlap)
+            else:
+                pieces, size = [], 0
+        pieces.append(piece)
+        size += len(piece)
+    if pieces:
+        chunks.append("".join(pieces))
+    return chunks
+
+
+def store_chunks(pdf_id, chunks, embeddings):
+    rows = [
+        (pdf_id, idx, chunk, embedding.tobytes())
+        for idx, (chunk, embedding) in enumerate(zip(chunks, embeddings))
+    ]
+    try:
+        with db.connection() as conn:
+            # One transaction, so readers never see a partial index
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO chunks (pdf_id, idx, text, embedding)"
+                    " VALUES (?, ?, ?, ?)",
+                    rows,
+                )
+            except sqlite3.Error:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+    except sqlite3.Error as e:
+        logger.error("SQLite error storing chunks for PDF ID %s: %s", pdf_id, e)
+        return
+    logger.info("Indexed %d chunks for PDF ID %s", len(chunks), pdf_id)
+    _write_embedding_file(pdf_id, embeddings)
+
+
+def _embedding_file(pdf_id):
+    return Path(db.DB_FILE).parent / "chunk_embeddings" / f"{pdf_id}.f32"
+
+
+def _write_embedding_file(pdf_id, embeddings):
+    """Saves the chunk embeddings as one float32 matrix beside the database.
+
+    Containers then map the file instead of each rebuilding the matrix from
+    SQLite. It is written under a temporary name and renamed into place so
+    readers never see a partial file.
+    """
+    path = _embedding_file(pdf_id)
+    tmp_path = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(tmp_path, "wb") as f:
+            for embedding in embeddings:
+                embedding.tofile(f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning("Could not write chunk embeddings for PDF ID %s: %s", pdf_id, e)
+        tmp_path.unlink(missing_ok=True)
+
+
+def _map_embedding_file(pdf_id, chunk_count):
+    """Returns a read-only view of each chunk's embedding, or None if unavailable."""
+    try:
+        with open(_embedding_file(pdf_id), "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    # A truncated file may not even hold whole floats
+    if not chunk_count or len(mapped) % (chunk_count * FLOAT_BYTES):
+        mapped.close()
+        return None
+    matrix = memoryview(mapped).cast("f")
+    dim = len(matrix) // chunk_count
+    return [matrix[i * dim : (i + 1) * dim] for i in range(chunk_count)]
+
+
+@functools.lru_cache(maxsize=32)
+def _load_chunk_index(pdf_id):
+    """Loads (embedding, text) pairs for a PDF in document order."""
+    with db.connection() as conn:
+        texts = [
+            row[0]
+            for row in conn.execute(
+                "SELECT text FROM chunks WHERE pdf_id = ? ORDER BY idx", (pdf_id,)
+            )
+        ]
+    embeddings = _map_embedding_file(pdf_id, len(texts))
+    if embeddings is None:
+        with db.connection() as conn:
+            rows = conn.execute(
+                "SELECT embedding FROM chunks WHERE pdf_id = ? ORDER BY idx",
+                (pdf_id,),
+            ).fetchall()
+        embeddings = []
+        for (embedding_bytes,) in rows:
+            embedding = array("f")
+            embedding.frombytes(embedding_bytes)
+            embeddings.append(embedding)
+        _write_embedding_file(pdf_id, embeddings)
+    return list(zip(embeddings, texts))
+
+
+def has_chunks(pdf_id):
+    # Queried directly rather than through the index cache, which would otherwise
+    # keep an empty index for PDFs still being indexed
+    try:
+        with db.connection() as conn:
+            return (
+                conn.execute(
+                    "SELECT 1 FROM chunks WHERE pdf_id = ? LIMIT 1", (pdf_id,)
+                ).fetchone()
+                is not None
+            )
+    except sqlite3.Error as e:
+        logger.error("SQLite error loading chunks for PDF ID %s: %s", pdf_id, e)
+        return False
+
+
+def top_chunks(pdf_id, embedding, k):
+    """Returns the texts of the k chunks most similar to `embedding`, in document order.
+
+    Only call this once has_chunks() is true. `embedding` must be normalized so
+    the dot product is the cosine similarity.
+    """
+    try:
+        index = _load_chunk_index(pdf_id)
+    except sqlite3.Error as e:
+        logger.error("SQLite error loading chunks for PDF ID %s: %s", pdf_id, e)
+        return []
+    best = heapq.nlargest(
+        k,
+        range(len(index)),
+        key=lambda i: math.sumprod(index[i][0], embedding),
+    )
+    return [index[i][1] for i in sorted(best)]
@@ -1,6 +1,26 @@
 import pytest
 
+from recruit_assist import answer_cache, db, deploy, main, retrieval
+
 
 @pytest.fixture
 def anyio_backend():
     return "asyncio"
+
+
+@pytest.fixture
+def db_file(tmp_path, monkeypatch):
+    """Points the app at a fresh, initialized SQLite database."""
+    db_file = str(tmp_path / "pdf_qa_logs.db")
+    monkeypatch.setattr(deploy, "DATA_DIR_IN_CONTAINER", tmp_path)
+    monkeypatch.setattr(deploy, "DB_FILE", db_file)
+    monkeypatch.setattr(db, "DB_FILE", db_file)
+    db.get_connection.cache_clear()
+    answer_cache._semantic_indexes.clear()
+    answer_cache._recent_answers.clear()
+    retrieval._load_chunk_index.cache_clear()
+    main.load_pdf_text.cache_clear()
+    deploy.init_db()
+    yield db_file
+    db.get_connection().close()
+    db.get_connection.cache_clear()
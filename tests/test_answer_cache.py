@@ -0,0 +1,82 @@
+import sqlite3
+
+from recruit_assist.answer_cache import (
+    add_semantic_entry,
+    answer_cache_key,
+    cache_answer,
+    find_similar_answer_key,
+    get_cached_answer,
+    has_semantic_entries,
+    normalize_embedding,
+)
+
+
+def test_answer_cache_key_normalizes_query():
+    """Tests that case and surrounding whitespace don't change the cache key."""
+    assert answer_cache_key("pdf", "  What is X? ") == answer_cache_key(
+        "pdf", "what is x?"
+    )
+    assert answer_cache_key("pdf", "what is x?") != answer_cache_key(
+        "other-pdf", "what is x?"
+    )
+
+
+def test_cached_answer_round_trip(db_file):
+    """Tests that a stored answer is returned for the same key."""
+    key = answer_cache_key("pdf", "What is X?")
+    assert get_cached_answer(key) is None
+
+    cache_answer(key, "X is a letter.")
+
+    assert get_cached_answer(key) == "X is a letter."
+
+
+def test_expired_answers_are_ignored(db_file, monkeypatch):
+    """Tests that answers past their TTL are treated as misses."""
+    monkeypatch.setattr("recruit_assist.answer_cache.ANSWER_CACHE_TTL_SECONDS", -1)
+    key = answer_cache_key("pdf", "What is X?")
+
+    cache_answer(key, "X is a letter.")
+
+    assert get_cached_answer(key) is None
+
+
+def test_semantic_cache_matches_similar_questions(db_file):
+    """Tests that a nearby embedding finds the cached answer and a distant one doesn't."""
+    key = answer_cache_key("pdf", "Summarize this document")
+    add_semantic_entry("pdf", normalize_embedding([1.0, 0.0, 0.0]), key)
+
+    assert find_similar_answer_key("pdf", normalize_embedding([1.0, 0.1, 0.0])) == key
+    assert find_similar_answer_key("pdf", normalize_embedding([0.0, 1.0, 0.0])) is None
+    assert (
+        find_similar_answer_key("other-pdf", normalize_embedding([1.0, 0.0, 0.0]))
+        is None
+    )
+
+
+def test_semantic_cache_sees_entries_from_other_containers(db_file):
+    """Tests that entries written through another connection are found."""
+    assert not has_semantic_entries("pdf")
+    key = answer_cache_key("pdf", "Summarize this document")
+    with sqlite3.connect(db_file) as conn:
+        conn.execute(
+            "INSERT INTO sem_cache (pdf_id, embedding, answer_key) VALUES (?, ?, ?)",
+            ("pdf", normalize_embedding([1.0, 0.0, 0.0]).tobytes(), key),
+        )
+    conn.close()
+
+    assert has_semantic_entries("pdf")
+    assert find_similar_answer_key("pdf", normalize_embedding([1.0, 0.1, 0.0])) == key
+
+
+def test_regenerated_answer_replaces_semantic_entry(db_file):
+    """Tests that indexing the same answer again doesn't add a duplicate row."""
+    key = answer_cache_key("pdf", "Summarize this document")
+    add_semantic_entry("pdf", normalize_embedding([1.0, 0.0, 0.0]), key)
+    add_semantic_entry("pdf", normalize_embedding([0.0, 1.0, 0.0]), key)
+
+    with sqlite3.connect(db_file) as conn:
+        (count,) = conn.execute("SELECT COUNT(*) FROM sem_cache").fetchone()
+    conn.close()
+    assert count == 1
+    assert find_similar_answer_key("pdf", normalize_embedding([0.0, 1.0, 0.0])) == key
@@ -0,0 +1,21 @@
+import sqlite3
+
+from recruit_assist import deploy
+
+
+def test_init_db_migrates_old_schema_once(db_file):
+    """Tests that init_db adds missing columns and is safe to run again."""
+    with sqlite3.connect(db_file) as conn:
+        conn.execute("DROP TABLE pdfs")
+        conn.execute(
+            "CREATE TABLE pdfs (id TEXT PRIMARY KEY, filename TEXT, text TEXT)"
+        )
+    conn.close()
+
+    deploy.init_db()
+    deploy.init_db()
+
+    conn = sqlite3.connect(db_file)
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(pdfs)")}
+    conn.close()
+    assert {"cache_name", "cache_expires_at"} <= columns
@@ -0,0 +1,20 @@
+import asyncio
+
+from recruit_assist import inflight
+
+
+async def test_broadcast_batches_chunks_for_late_subscribers(anyio_backend):
+    """Tests that a subscriber gets every chunk, joined into batches."""
+
+    async def produce(broadcast):
+        for chunk in ["a", "b", "c"]:
+            broadcast.publish(chunk)
+            await asyncio.sleep(0)
+
+    broadcast = inflight.broadcast_once("key", produce)
+    await broadcast.task
+
+    batches = [batch async for batch in broadcast.subscribe(1, 2)]
+
+    assert batches == ["ab", "c"]
+    assert not inflight.is_running("key")
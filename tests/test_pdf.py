@@ -0,0 +1,40 @@
+import tempfile
+
+import fitz
+
+from recruit_assist import pdf
+
+
+def make_pdf(page_texts):
+    doc = fitz.open()
+    for text in page_texts:
+        doc.new_page().insert_text((72, 72), text)
+    return doc.tobytes()
+
+
+async def test_extract_text_keeps_page_order(anyio_backend):
+    """Tests that text from every page is returned in order."""
+    pdf_bytes = make_pdf(["first page", "second page"])
+
+    assert await pdf.extract_text(pdf_bytes) == "first page\nsecond page\n"
+
+
+async def test_parallel_extraction_matches_serial(anyio_backend, monkeypatch):
+    """Tests that sharding pages across processes gives the same text."""
+    pdf_bytes = make_pdf([f"page {i}" for i in range(5)])
+    monkeypatch.setattr(pdf, "PDF_PARALLEL_MIN_PAGES", 2)
+    monkeypatch.setattr(pdf, "PDF_WORKERS", 2)
+
+    assert await pdf.extract_text(pdf_bytes) == pdf.extract_text_from_pdf(pdf_bytes)
+
+
+async def test_extracts_from_upload_spooled_to_disk(anyio_backend):
+    """Tests that a memory-mapped upload gives the same text as its bytes."""
+    pdf_bytes = make_pdf(["first page", "second page"])
+    with tempfile.SpooledTemporaryFile(max_size=1) as upload:
+        upload.write(pdf_bytes)
+        with pdf.read_upload(upload) as mapped:
+            assert isinstance(mapped, memoryview)
+            text = await pdf.extract_text(mapped)
+
+    assert text == "first page\nsecond page\n"
@@ -0,0 +1,35 @@
+from array import array
+
+from recruit_assist import retrieval
+from recruit_assist.retrieval import chunk_text, store_chunks, top_chunks
+
+
+def test_chunks_never_exceed_the_limit():
+    """Tests that unpunctuated text, table rows and long tokens are still split."""
+    for text in ("word " * 1000, "a | b | c\n" * 500, "x" * 450):
+        chunks = chunk_text(text, 100)
+
+        assert len(chunks) > 1
+        assert all(len(chunk) <= 100 for chunk in chunks)
+
+
+def test_chunks_keep_sentences_together_with_overlap():
+    """Tests that chunks hold whole sentences and share one with their neighbour."""
+    chunks = chunk_text("One two. Three four. Five six. Seven eight.", 22)
+
+    assert chunks == [
+        "One two. Three four. ",
+        "Three four. Five six. ",
+        "Five six. Seven eight.",
+    ]
+
+
+def test_truncated_embedding_file_falls_back_to_sqlite(db_file):
+    """Tests that a damaged embedding file is ignored and rewritten."""
+    embeddings = [array("f", [1.0, 0.0]), array("f", [0.0, 1.0])]
+    store_chunks("pdf", ["first", "second"], embeddings)
+    path = retrieval._embedding_file("pdf")
+    path.write_bytes(path.read_bytes()[:-3])
+
+    assert top_chunks("pdf", array("f", [0.0, 1.0]), 1) == ["second"]
+    assert path.stat().st_size == 4 * 4
@@ -0,0 +1,325 @@
+import asyncio
+import hashlib
+import io
+from pathlib import Path
+from types import SimpleNamespace
+import urllib.parse
+
+import fitz
+from httpx import ASGITransport, AsyncClient
+import pytest
+
+from recruit_assist import db, main
+
+
+class FakeModelClient:
+    """Stands in for `genai.Client`, streaming a canned answer."""
+
+    def __init__(self, answer_chunks, cache_available=False, embed=None):
+        self.answer_chunks = answer_chunks
+        self.cache_available = cache_available
+        self.embed = embed
+        self.generate_calls = []
+        self.aio = SimpleNamespace(
+            caches=SimpleNamespace(create=self._create_cache),
+            models=SimpleNamespace(
+                generate_content_stream=self._generate, embed_content=self._embed
+            ),
+        )
+
+    async def _generate(self, **kwargs):
+        self.generate_calls.append(kwargs)
+
+        async def stream():
+            for chunk in self.answer_chunks:
+                yield SimpleNamespace(text=chunk)
+
+        return stream()
+
+    async def _create_cache(self, **kwargs):
+        if not self.cache_available:
+            raise RuntimeError("Context caching unavailable in tests")
+        return SimpleNamespace(name="cachedContents/test")
+
+    async def _embed(self, contents, **kwargs):
+        if self.embed is None:
+            raise RuntimeError("Embeddings unavailable in tests")
+        texts = [contents] if isinstance(contents, str) else contents
+        return SimpleNamespace(
+            embeddings=[SimpleNamespace(values=self.embed(text)) for text in texts]
+        )
+
+
+@pytest.fixture
+def model_client(monkeypatch):
+    client = FakeModelClient(["The PDF ", "says hello."])
+    monkeypatch.setattr(main, "get_model_client", lambda: client)
+    return client
+
+
+def make_pdf(text):
+    doc = fitz.open()
+    doc.new_page().insert_text((72, 72), text)
+    return doc.tobytes()
+
+
+def sse_messages(body):
+    """Joins the data of all `message` events in an SSE response body."""
+    messages = []
+    for event in body.split("\n\n"):
+        lines = event.split("\n")
+        if "event: close" in lines or not event:
+            continue
+        messages.append(
+            "\n".join(line[6:] for line in lines if line.startswith("data: "))
+        )
+    return "".join(messages)
+
+
+async def upload(client, pdf_bytes, filename="test.pdf"):
+    return await client.post(
+        "/upload_pdf",
+        files={"pdf_file": (filename, pdf_bytes, "application/pdf")},
+    )
+
+
+async def ask(client, pdf_id, query):
+    params = urllib.parse.urlencode({"query": query, "pdf_id": pdf_id})
+    return await client.get(f"/answer-stream?{params}")
+
+
+@pytest.fixture
+async def client(db_file):
+    transport = ASGITransport(app=main.app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
+
+
+async def test_upload_then_answer_streams_and_caches(
+    anyio_backend, client, model_client, db_file
+):
+    """Tests the upload -> question flow and that a repeat question skips Gemini."""
+    pdf_bytes = make_pdf("Hello from the test PDF")
+    response = await upload(client, pdf_bytes)
+    assert response.status_code == 200
+    assert "PDF Uploaded: test.pdf" in response.text
+    assert f"Size: {len(pdf_bytes)} bytes" in response.text
+
+    pdf_id = main.pdf_id_for(io.BytesIO(pdf_bytes))
+    first = await ask(client, pdf_id, "What does it say?")
+    second = await ask(client, pdf_id, "  what does it say? ")
+
+    for response in (first, second):
+        assert response.status_code == 200
+        assert sse_messages(response.text) == "The PDF says hello."
+        assert "event: close" in response.text
+    assert len(model_client.generate_calls) == 1
+    prompt = "".join(model_client.generate_calls[0]["contents"])
+    assert "Hello from the test PDF" in prompt
+
+
+async def test_questions_use_context_cache(
+    anyio_backend, client, model_client, monkeypatch
+):
+    """Tests that questions reference the uploaded context instead of the text."""
+    monkeypatch.setattr(main, "CONTEXT_CACHE_MIN_CHARS", 0)
+    model_client.cache_available = True
+    pdf_bytes = make_pdf("Hello from the test PDF")
+    await upload(client, pdf_bytes)
+
+    response = await ask(
+        client, main.pdf_id_for(io.BytesIO(pdf_bytes)), "What does it say?"
+    )
+
+    assert sse_messages(response.text) == "The PDF says hello."
+    (call,) = model_client.generate_calls
+    assert call["config"].cached_content == "cachedContents/test"
+    assert "Hello from the test PDF" not in "".join(call["contents"])
+
+
+async def test_failed_context_cache_is_recreated(
+    anyio_backend, client, model_client, monkeypatch
+):
+    """Tests that a context cache Gemini rejects is dropped and made again."""
+    monkeypatch.setattr(main, "CONTEXT_CACHE_MIN_CHARS", 0)
+    model_client.cache_available = True
+    generate = model_client.aio.models.generate_content_stream
+
+    async def evicted_cache(**kwargs):
+        if kwargs.get("config") is not None:
+            raise RuntimeError("404 NOT_FOUND: cached content not found")
+        return await generate(**kwargs)
+
+    model_client.aio.models.generate_content_stream = evicted_cache
+    pdf_bytes = make_pdf("Hello from the test PDF")
+    await upload(client, pdf_bytes)
+    pdf_id = main.pdf_id_for(io.BytesIO(pdf_bytes))
+
+    response = await ask(client, pdf_id, "What does it say?")
+
+    assert sse_messages(response.text) == "The PDF says hello."
+    with db.connection() as conn:
+        assert conn.execute(
+            "SELECT cache_name, cache_expires_at FROM pdfs WHERE id = ?", (pdf_id,)
+        ).fetchone() == (None, None)
+
+    model_client.aio.models.generate_content_stream = generate
+    await ask(client, pdf_id, "Who wrote it?")
+
+    assert model_client.generate_calls[-1]["config"].cached_content == (
+        "cachedContents/test"
+    )
+
+
+async def test_interaction_log_is_flushed_on_shutdown(anyio_backend, db_file):
+    """Tests that queued interactions are written by the background writer."""
+    async with main.lifespan(main.app):
+        for i in range(3):
+            await main.log_interaction("pdf", f"question {i}", "answer")
+
+    with db.connection() as conn:
+        rows = conn.execute("SELECT query FROM interactions ORDER BY query").fetchall()
+    assert rows == [("question 0",), ("question 1",), ("question 2",)]
+
+
+async def test_pdf_exists_skips_upload_for_known_pdf(
+    anyio_backend, client, model_client
+):
+    """Tests that a known digest returns the question form and others 404."""
+    pdf_bytes = make_pdf("Hello from the test PDF")
+    sha256 = hashlib.sha256(pdf_bytes).hexdigest()
+    params = {"sha256": sha256, "filename": "test.pdf", "size": len(pdf_bytes)}
+    headers = {"HX-Request": "true"}
+
+    missing = await client.get("/pdf-exists", params=params, headers=headers)
+    await upload(client, pdf_bytes)
+    known = await client.get("/pdf-exists", params=params, headers=headers)
+    invalid = await client.get(
+        "/pdf-exists", params={**params, "sha256": "abc"}, headers=headers
+    )
+
+    assert missing.status_code == 404
+    assert known.status_code == 200
+    assert main.pdf_id_for(io.BytesIO(pdf_bytes)) in known.text
+    assert invalid.status_code == 400
+
+
+async def test_concurrent_identical_questions_share_one_answer(
+    anyio_backend, client, model_client
+):
+    """Tests that identical questions asked at once make a single Gemini call."""
+    pdf_bytes = make_pdf("Hello from the test PDF")
+    await upload(client, pdf_bytes)
+    pdf_id = main.pdf_id_for(io.BytesIO(pdf_bytes))
+
+    responses = await asyncio.gather(
+        *(ask(client, pdf_id, "What does it say?") for _ in range(3))
+    )
+
+    for response in responses:
+        assert sse_messages(response.text) == "The PDF says hello."
+    assert len(model_client.generate_calls) == 1
+
+
+def test_load_pdf_compresses_legacy_rows(db_file):
+    """Tests that text stored uncompressed is returned and migrated on read."""
+    with db.connection() as conn:
+        conn.execute(
+            "INSERT INTO pdfs (id, filename, text) VALUES (?, ?, ?)",
+            ("legacy", "old.pdf", "Old text"),
+        )
+
+    assert main.load_pdf("legacy") == ("Old text", None, None)
+    with db.connection() as conn:
+        (text,) = conn.execute("SELECT text FROM pdfs WHERE id = 'legacy'").fetchone()
+        (text_z,) = conn.execute(
+            "SELECT text_z FROM pdf_text WHERE id = 'legacy'"
+        ).fetchone()
+    assert text is None
+    assert main.decompress_text(text_z) == "Old text"
+    main.load_pdf_text.cache_clear()
+    assert main.load_pdf("legacy") == ("Old text", None, None)
+
+
+async def test_large_pdfs_are_answered_from_relevant_chunks(
+    anyio_backend, client, model_client, monkeypatch, db_file
+):
+    """Tests that only the chunks closest to the question are sent to Gemini."""
+    monkeypatch.setattr(main, "RETRIEVAL_MIN_CHARS", 10)
+    monkeypatch.setattr(main, "RETRIEVAL_CHUNK_CHARS", 12)
+    monkeypatch.setattr(main, "RETRIEVAL_TOP_K", 1)
+    model_client.embed = lambda text: [1.0, 0.0] if "dog" in text.lower() else [0, 1]
+    pdf_bytes = make_pdf("Cats purr. Birds sing. Dogs bark.")
+    await upload(client, pdf_bytes)
+
+    await ask(client, main.pdf_id_for(io.BytesIO(pdf_bytes)), "What do dogs do?")
+
+    (call,) = model_client.generate_calls
+    prompt = "".join(call["contents"])
+    assert "Dogs bark." in prompt
+    assert "Cats purr." not in prompt
+    pdf_id = main.pdf_id_for(io.BytesIO(pdf_bytes))
+    assert (Path(db_file).parent / "chunk_embeddings" / f"{pdf_id}.f32").exists()
+
+
+async def test_pages_are_compressed_but_answers_stream(
+    anyio_backend, client, model_client
+):
+    """Tests that HTML is gzipped while the SSE answer stream is left as is."""
+    pdf_bytes = make_pdf("Hello from the test PDF")
+    await upload(client, pdf_bytes)
+
+    page = await client.get("/")
+    answer = await ask(client, main.pdf_id_for(io.BytesIO(pdf_bytes)), "Hi?")
+
+    assert page.headers["content-encoding"] == "gzip"
+    assert "content-encoding" not in answer.headers
+
+
+async def test_answers_are_html_escaped(anyio_backend, client, model_client):
+    """Tests that live and cached answers can't inject markup into the page."""
+    model_client.answer_chunks = ["<b>", "& done"]
+    pdf_bytes = make_pdf("Hello from the test PDF")
+    await upload(client, pdf_bytes)
+    pdf_id = main.pdf_id_for(io.BytesIO(pdf_bytes))
+
+    live = await ask(client, pdf_id, "What does it say?")
+    cached = await ask(client, pdf_id, "What does it say?")
+
+    for response in (live, cached):
+        assert sse_messages(response.text) == "&lt;b&gt;&amp; done"
+    assert len(model_client.generate_calls) == 1
+
+
+async def test_paraphrased_question_reuses_answer(anyio_backend, client, model_client):
+    """Tests that the first answer is indexed for the semantic cache after streaming."""
+    model_client.embed = lambda text: [1.0, 0.0]
+    pdf_bytes = make_pdf("Hello from the test PDF")
+    await upload(client, pdf_bytes)
+    pdf_id = main.pdf_id_for(io.BytesIO(pdf_bytes))
+
+    first = await ask(client, pdf_id, "What does it say?")
+    second = await ask(client, pdf_id, "What is written in it?")
+
+    for response in (first, second):
+        assert sse_messages(response.text) == "The PDF says hello."
+    assert len(model_client.generate_calls) == 1
+
+
+async def test_failed_generation_is_not_logged(anyio_backend, client, model_client):
+    """Tests that an LLM error reaches the user but not the interaction log."""
+
+    async def fail(**kwargs):
+        raise RuntimeError("Gemini unavailable")
+
+    model_client.aio.models.generate_content_stream = fail
+    pdf_bytes = make_pdf("Hello from the test PDF")
+    await upload(client, pdf_bytes)
+
+    response = await ask(
+        client, main.pdf_id_for(io.BytesIO(pdf_bytes)), "What does it say?"
+    )
+
+    assert sse_messages(response.text) == main.LLM_ERROR_MESSAGE
+    with db.connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM interactions").fetchone() == (0,)